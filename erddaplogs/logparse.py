@@ -1,53 +1,49 @@
-from copy import copy
+from functools import lru_cache
 from datetime import datetime
 from apachelogs import LogParser
 from pathlib import Path
 import polars as pl
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from user_agents import parse
 import requests
-import re
 import gzip
+import time
 import xml.etree.ElementTree as ET
 
+IP_API_BATCH_SIZE = 100
+LOG_BLOCK_SIZE = 1024 * 1024
 
-def _load_apache_logs(apache_logs_dir,wildcard_fname):
+
+def _parse_apache_log(fn):
     """
-    Parses apache logs.
+    Parses a single apache log file.
 
     Parameters
     ----------
-    apache_logs_dir: str
-        dir with apache log files
-    wildcard_fname: str
-        apache access logfile name string allowing for wildcard
+    fn: pathlib.Path
+        apache access logfile
     Returns
     -------
     polars.DataFrame
         parsed requests information
     """
-    apache_logs = list(Path(apache_logs_dir).glob(wildcard_fname))
-    if len(apache_logs) == 0:
-        raise ValueError(
-            f"Supplied directory {apache_logs_dir} contains no access.log files",
-        )
     parser = LogParser('%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i"')
     dt, ip, url, ua, code, bytes_sent, referer = [], [], [], [], [], [], []
-    for fn in apache_logs:
-        with open(fn) as fp:
-            for entry in parser.parse_lines(fp):
-                try:
-                    this_url = entry.request_line.split(" ")[1]
-                except IndexError:
-                    this_url = ""
-                dt.append(entry.request_time)
-                ip.append(entry.remote_host)
-                url.append(this_url)
-                ua.append(entry.headers_in["User-Agent"])
-                code.append(entry.final_status)
-                bytes_sent.append(entry.bytes_sent)
-                referer.append(entry.headers_in["Referer"])
-    df = pl.DataFrame(
+    with open(fn) as fp:
+        for entry in parser.parse_lines(fp):
+            try:
+                this_url = entry.request_line.split(" ")[1]
+            except IndexError:
+                this_url = ""
+            dt.append(entry.request_time)
+            ip.append(entry.remote_host)
+            url.append(this_url)
+            ua.append(entry.headers_in["User-Agent"])
+            code.append(entry.final_status)
+            bytes_sent.append(entry.bytes_sent)
+            referer.append(entry.headers_in["Referer"])
+    return pl.DataFrame(
         {
             "ip": ip,
             "datetime": dt,
@@ -56,13 +52,88 @@ def _load_apache_logs(apache_logs_dir,wildcard_fname):
             "status-code": code,
             "bytes-sent": bytes_sent,
             "referer": referer,
-        }
-    ).with_columns(pl.col("datetime").dt.replace_time_zone(None))
-    df = df.with_columns(pl.col("status-code").cast(pl.Int64))
-    df = df.with_columns(pl.col("bytes-sent").cast(pl.Int64))
+        },
+        schema={
+            "ip": pl.Utf8,
+            "datetime": pl.Datetime("us", "UTC"),
+            "url": pl.Utf8,
+            "user-agent": pl.Utf8,
+            "status-code": pl.Int64,
+            "bytes-sent": pl.Int64,
+            "referer": pl.Utf8,
+        },
+    )
+
+
+def _load_apache_logs(apache_logs_dir, wildcard_fname, processes=None):
+    """
+    Parses apache logs.
+
+    Parameters
+    ----------
+    apache_logs_dir: str
+        dir with apache log files
+    wildcard_fname: str
+        apache access logfile name string allowing for wildcard
+    processes: int, default=None
+        if set, parse the log files in parallel with this many worker
+        processes. Workers are spawned, so a calling script must guard its
+        entry point with ``if __name__ == "__main__":``
+    Returns
+    -------
+    polars.DataFrame
+        parsed requests information
+    """
+    apache_logs = list(Path(apache_logs_dir).glob(wildcard_fname))
+    if len(apache_logs) == 0:
+        raise ValueError(
+            f"Supplied directory {apache_logs_dir} contains no access.log files",
+        )
+    if processes is None or len(apache_logs) == 1:
+        frames = [_parse_apache_log(fn) for fn in apache_logs]
+    else:
+        # polars is not fork-safe, so worker processes are spawned
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=get_context("spawn")
+        ) as executor:
+            frames = list(executor.map(_parse_apache_log, apache_logs))
+    df = pl.concat(frames, how="vertical").rechunk()
+    df = df.with_columns(pl.col("datetime").dt.replace_time_zone(None))
     return df
 
 
+def _read_line_blocks(logfile, block_size=None):
+    """
+    Read a binary file object in blocks that end on a line boundary.
+
+    Parameters
+    ----------
+    logfile: file object
+        log file opened in binary mode
+    block_size: int, default=None
+        number of bytes to read at a time. If None, LOG_BLOCK_SIZE is used
+
+    Yields
+    ------
+    bytes
+        complete log lines, at most about block_size bytes at a time
+    """
+    if block_size is None:
+        block_size = LOG_BLOCK_SIZE
+    remainder = b""
+    while True:
+        block = logfile.read(block_size)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b"\n") + 1
+        remainder = block[cut:]
+        if cut:
+            yield block[:cut]
+    if remainder:
+        yield remainder
+
+
 def _load_nginx_logs(nginx_logs_dir, wildcard_fname):
     """
     Parses nginx logs.
@@ -84,50 +155,51 @@ def _load_nginx_logs(nginx_logs_dir, wildcard_fname):
         raise ValueError(
             f"Supplied directory {nginx_logs_dir} contains no tomcat-access.log files",
         )
-    lineformat = re.compile(
-        r"""(?P<ipaddress>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}) - - \[(?P<dateandtime>\d{2}/[a-z]{3}/\d{4}:\d{2}:\d{2}:\d{2} ([+\-])\d{4})] ((\"(GET|POST|HEAD|PUT|DELETE) )(?P<url>.+)(http/(1\.1|2\.0)")) (?P<statuscode>\d{3}) (?P<bytessent>\d+) (?P<refferer>-|"([^"]+)") (["](?P<useragent>[^"]+)["])""",
-        re.IGNORECASE,
-    )
-    ip, datetimestring, url, bytessent, referer, useragent, status, method = (
-        [],
-        [],
-        [],
-        [],
-        [],
-        [],
-        [],
-        [],
-    )
+    # any host and ident/user fields and any HTTP/x.y version are accepted;
+    # lines whose request url contains spaces do not match and are dropped
+    lineformat = r'(?i)^(?P<ipaddress>\S+) \S+ \S+ \[(?P<dateandtime>[^\]]+)\] "(?P<method>GET|POST|HEAD|PUT|DELETE) (?P<url>\S+) HTTP/[\d.]+" (?P<statuscode>\d{3}) (?P<bytessent>\d+) (?P<refferer>-|"[^"]*") "(?P<useragent>[^"]*)"'
+    columns = {
+        "ipaddress": "ip",
+        "dateandtime": "datetime",
+        "url": "url",
+        "useragent": "user-agent",
+        "statuscode": "status-code",
+        "bytessent": "bytes-sent",
+        "refferer": "referer",
+    }
+    read_lines_kwargs = {
+        "has_header": False,
+        "separator": "\x00",
+        "quote_char": None,
+        "schema": {"line": pl.Utf8},
+        "encoding": "utf8-lossy",
+        "truncate_ragged_lines": True,
+    }
+    frames = []
     for f in csvs:
         if str(f).endswith(".gz"):
             logfile = gzip.open(f)
         else:
-            logfile = open(f)
-        for line in logfile.readlines():
-            data = re.search(lineformat, line)
-            if data:
-                datadict = data.groupdict()
-                ip.append(datadict["ipaddress"])
-                datetimestring.append(datadict["dateandtime"])
-                url.append(datadict["url"])
-                bytessent.append(datadict["bytessent"])
-                referer.append(datadict["refferer"])
-                useragent.append(datadict["useragent"])
-                status.append(datadict["statuscode"])
-                method.append(data.group(6))
-        logfile.close()
-
-    df = pl.DataFrame(
-        {
-            "ip": ip,
-            "datetime": datetimestring,
-            "url": url,
-            "user-agent": useragent,
-            "status-code": status,
-            "bytes-sent": bytessent,
-            "referer": referer,
-        }
-    )
+            logfile = open(f, "rb")
+        with logfile:
+            for block in _read_line_blocks(logfile):
+                # polars splits the block into lines, then all named fields
+                # are extracted in a single vectorized regex pass
+                df_block = (
+                    pl.read_csv(block, **read_lines_kwargs)
+                    .select(
+                        pl.col("line").str.extract_groups(lineformat).alias("groups")
+                    )
+                    .unnest("groups")
+                    .select(list(columns))
+                    .rename(columns)
+                    .filter(pl.col("ip").is_not_null())
+                )
+                frames.append(df_block)
+
+    if not frames:
+        frames.append(pl.DataFrame(schema={name: pl.Utf8 for name in columns.values()}))
+    df = pl.concat(frames, how="vertical")
     df = df.with_columns(pl.col("status-code").cast(pl.Int64))
     df = df.with_columns(pl.col("bytes-sent").cast(pl.Int64))
     # convert timestamp to datetime
@@ -140,14 +212,54 @@ def _load_nginx_logs(nginx_logs_dir, wildcard_fname):
     return df_nginx
 
 
+def _post_ip_batch(ips):
+    """
+    Fetch information for a batch of ip addresses from http://ip-api.com.
+
+    A throttled (429) request is retried once, after waiting for the rate
+    limit window to reset as given by the X-Ttl header.
+
+    Parameters
+    ----------
+    ips: list of str
+        up to IP_API_BATCH_SIZE ip addresses
+
+    Returns
+    -------
+    requests.Response
+        response from the batch endpoint, a json list with one entry per ip
+    """
+    for attempt in range(2):
+        resp_raw = requests.post(
+            "http://ip-api.com/batch", json=[{"query": ip} for ip in ips]
+        )
+        if resp_raw.status_code != 429:
+            break
+        wait = int(resp_raw.headers.get("X-Ttl", 60))
+        if attempt == 0:
+            print(f"Exceeded API responses. Waiting {wait} seconds")
+            time.sleep(wait)
+    return resp_raw
+
+
+def _is_valid_ip_response(resp):
+    """Check that an ip-api response can be stored as one row of ip info."""
+    if not isinstance(resp, dict) or "query" not in resp:
+        return False
+    return all(
+        value is None or isinstance(value, (str, int, float, bool))
+        for value in resp.values()
+    )
+
+
 def _get_ip_info(df, ip_info_csv, download_new=True, num_new_ips=60, verbose=False):
     """
     Add ip-derived information to the requests DataFrame.
 
     If it exists, read a .csv file with ip-derived info. If said file does
     not exist, get ip-derived information from requests ip addresses
-    using http://ip-api.com. Add this info to the requests DataFrame and
-    create a csv file with the ip-derived information.
+    using the http://ip-api.com batch endpoint. Add this info to the
+    requests DataFrame and create a csv file with the ip-derived information.
 
     Parameters
     ----------
@@ -167,7 +279,7 @@ def _get_ip_info(df, ip_info_csv, download_new=True, num_new_ips=60, verbose=Fal
     polars.DataFrame
         ip-derived information
     """
-    ip_counts = Counter(df["ip"]).most_common()
+    ip_counts = df.get_column("ip").value_counts(sort=True).iter_rows()
     if Path(ip_info_csv).exists():
         df_ip = pl.read_csv(ip_info_csv)
     else:
@@ -190,17 +302,38 @@ def _get_ip_info(df, ip_info_csv, download_new=True, num_new_ips=60, verbose=Fal
             }
         )
     if download_new:
-        fetched_ips = 0
+        known_ips = set(df_ip["query"].to_list())
+        new_ips = []
         for ip, count in ip_counts:
-            if ip not in df_ip["query"]:
-                if fetched_ips >= num_new_ips:
+            if ip not in known_ips:
+                if len(new_ips) >= num_new_ips:
                     break
-                resp_raw = requests.get(f"http://ip-api.com/json/{ip}")
-                fetched_ips += 1
-                if resp_raw.status_code == 429:
-                    print("Exceeded API responses. Wait a minute and try again")
-                    break
-                resp = resp_raw.json()
+                new_ips.append((ip, count))
+        new_rows = []
+        resp_raw = None
+        for start in range(0, len(new_ips), IP_API_BATCH_SIZE):
+            batch = new_ips[start : start + IP_API_BATCH_SIZE]
+            if resp_raw is not None and resp_raw.headers.get("X-Rl") == "0":
+                # no requests left in this rate limit window, wait for it to reset
+                time.sleep(int(resp_raw.headers.get("X-Ttl", 60)))
+            resp_raw = _post_ip_batch([ip for ip, count in batch])
+            if resp_raw.status_code == 429:
+                print("Exceeded API responses. Wait a minute and try again")
+                break
+            try:
+                payload = resp_raw.json() if resp_raw.ok else None
+            except ValueError:
+                payload = None
+            if not isinstance(payload, list):
+                print(
+                    f"Unexpected response from ip-api (status {resp_raw.status_code}), "
+                    "stopping ip lookup"
+                )
+                break
+            for (ip, count), resp in zip(batch, payload):
+                if not _is_valid_ip_response(resp):
+                    print(f"Issue fetching data for this ip address {ip}, skipping")
+                    continue
                 if verbose:
                     if "country" in resp.keys():
                         print(
@@ -208,10 +341,14 @@ def _get_ip_info(df, ip_info_csv, download_new=True, num_new_ips=60, verbose=Fal
                         )
                     else:
                         print(f"New ip identified: {ip}. Sent {count} requests")
-                try:
-                    df_ip = pl.concat((df_ip, pl.DataFrame(resp)), how="diagonal")
-                except (pl.exceptions.SchemaError, pl.exceptions.ShapeError):
-                    print(f"Issue fetching data for this ip address {ip}, skipping")
+                new_rows.append(resp)
+        if new_rows:
+            # build the new rows in one go rather than concatenating per response
+            try:
+                df_new = pl.DataFrame(new_rows, infer_schema_length=None)
+                df_ip = pl.concat((df_ip, df_new), how="diagonal_relaxed").rechunk()
+            except (pl.exceptions.SchemaError, pl.exceptions.ShapeError):
+                print("Issue fetching data for new ip addresses, skipping")
     df_ip.write_csv(ip_info_csv)
     if verbose:
         print(f"We have info on {len(df_ip)} ip address")
@@ -237,64 +374,166 @@ def _parse_columns(df):
     polars.DataFrame
         requests DataFrame with additional information, suitable for plotting
     """
+    parsed_columns = [
+        "base_url",
+        "erddap_request_type",
+        "dataset_id",
+        "request_kwargs",
+        "file_type",
+        "user_agent_base",
+        "ip_group",
+        "ip_subnet",
+    ]
+    # drop columns left by a previous call, so that parsing can be rerun
+    df = df.select(pl.exclude(parsed_columns))
     df = df.with_columns(pl.col("country").fill_null("unknown"))
-    df_parts = df["url"].to_pandas().str.replace(" ", "").str.split("?", expand=True)
-    df = df.with_columns(base_url=df_parts[0].str.split(".", expand=True)[0].astype(str).values)
-    url_parts = df["base_url"].to_pandas().str.split("/", expand=True)
-    url_parts["protocol"] = None
-    url_parts.loc[url_parts[2] == "tabledap", "protocol"] = "tabledap"
-    url_parts.loc[url_parts[2] == "griddap", "protocol"] = "griddap"
-    url_parts.loc[url_parts[2] == "files", "protocol"] = "files"
-    url_parts.loc[url_parts[2] == "info", "protocol"] = "info"
-    url_parts["dataset_id"] = url_parts[3]
-    df = df.with_columns(erddap_request_type=url_parts["protocol"].astype(str).values)
-    df = df.with_columns(dataset_id=url_parts["dataset_id"].astype(str).values)
     df = df.with_columns(
-        dataset_id=pl.when(pl.col("erddap_request_type").is_null())
-        .then(None)
-        .otherwise(pl.col("dataset_id"))
+        pl.col("url")
+        .str.replace_all(" ", "", literal=True)
+        .str.split_exact("?", 1)
+        .struct.rename_fields(["base_url_raw", "request_kwargs"])
+        .alias("url_parts")
+    ).unnest("url_parts")
+    df = (
+        df.with_columns(
+            pl.col("base_url_raw")
+            .str.split_exact(".", 1)
+            .struct.rename_fields(["base_url", "file_type"])
+            .alias("base_url_parts")
+        )
+        .unnest("base_url_parts")
+        .drop("base_url_raw")
     )
-    df = df.with_columns(request_kwargs=df_parts[1].astype(str).values)
-    df = df.with_columns(file_type=df_parts[0].str.split(".", expand=True)[1].astype(str).values)
+    df = df.with_columns(base_url_parts=pl.col("base_url").str.split("/"))
+    is_known = (
+        pl.col("base_url_parts")
+        .list.get(2)
+        .is_in(["tabledap", "griddap", "files", "info"])
+    )
+    df = df.with_columns(
+        erddap_request_type=pl.when(is_known)
+        .then(pl.col("base_url_parts").list.get(2))
+        .otherwise(None),
+        dataset_id=pl.when(is_known)
+        .then(pl.col("base_url_parts").list.get(3))
+        .otherwise(None),
+    ).drop("base_url_parts")
     df = df.with_columns(
-        user_agent_base=df["user-agent"]
-        .to_pandas()
-        .str.split(" ", expand=True)[0]
-        .str.split("/", expand=True)[0]
-        .values
+        user_agent_base=pl.col("user-agent").str.extract(r"^([^ /]*)"),
+        ip_group=pl.col("ip").str.extract(r"^(\d+\.\d+)"),
+        ip_subnet=pl.col("ip").str.extract(r"^(\d+\.\d+\.\d+)"),
     )
-    ip_grid = df["ip"].to_pandas().str.split(".", expand=True)
-    ip_group = ip_grid[0] + "." + ip_grid[1]
-    ip_subnet = ip_grid[0] + "." + ip_grid[1] + "." + ip_grid[2]
-    df = df.with_columns(ip_group=ip_group.values)
-    df = df.with_columns(ip_subnet=ip_subnet.values)
+    df = df.select(pl.exclude(parsed_columns), *parsed_columns)
     df = df.sort(by="datetime")
 
     return df
 
 
+@lru_cache(maxsize=None)
+def _user_agent_fields(ua):
+    """Parse a user agent string into (browser, device, os, is_bot)."""
+    parsed = parse(ua)
+    return (
+        parsed.browser.family,
+        parsed.device.family,
+        parsed.os.family,
+        parsed.is_bot,
+    )
+
+
+def _user_agent_lookup(user_agents):
+    """
+    Build a table of parsed user agent information.
+
+    Each distinct user agent is parsed only once, so the result can be
+    joined back onto the requests DataFrame.
+
+    Parameters
+    ----------
+    user_agents: polars.Series
+        user agent strings
+
+    Returns
+    -------
+    polars.DataFrame
+        one row per distinct user agent, with BrowserFamily, DeviceFamily,
+        OS and is_bot columns
+    """
+    unique_agents = user_agents.drop_nulls().unique().to_list()
+    fields = [_user_agent_fields(ua) for ua in unique_agents]
+    browser, device, os_family, is_bot = zip(*fields) if fields else ([], [], [], [])
+    return pl.DataFrame(
+        {
+            "user-agent": unique_agents,
+            "BrowserFamily": list(browser),
+            "DeviceFamily": list(device),
+            "OS": list(os_family),
+            "is_bot": list(is_bot),
+        },
+        schema={
+            "user-agent": pl.Utf8,
+            "BrowserFamily": pl.Utf8,
+            "DeviceFamily": pl.Utf8,
+            "OS": pl.Utf8,
+            "is_bot": pl.Boolean,
+        },
+    )
+
+
+def _contains_any(column, strings, case_insensitive=False):
+    """
+    Build an expression matching rows where column contains any of strings.
+
+    The strings are matched literally, all in a single scan of the column.
+
+    Parameters
+    ----------
+    column: str
+        name of the string column to search
+    strings: iterable of str
+        substrings to look for
+    case_insensitive: bool, default=False
+        if True, ignore ASCII case when matching
+
+    Returns
+    -------
+    polars.Expr
+        boolean expression, True where any of the strings is present
+    """
+    if not strings:
+        return pl.lit(False)
+    return pl.col(column).str.contains_any(
+        list(strings), ascii_case_insensitive=case_insensitive
+    )
+
+
 def _print_filter_stats(call_wrap):
     """
     Decorator to the filter methods.
 
     Modify filter_* methods so they print dataset information
-    before and after filtering.
+    before and after filtering. Counting the requests runs the pending
+    query plan, so this is only done in verbose mode.
     """
 
     def magic(self):
+        if not self.verbose:
+            # leave the filter pending in the lazy query plan
+            call_wrap(self)
+            return
         len_before = len(self.df)
         call_wrap(self)
-        if self.verbose:
-            print(
-                f"Filter {self.filter_name} dropped {len_before - len(self.df)} lines. Length of dataset is now "
-                f"{int(len(self.df) / self.original_total_requests * 100)} % of original"
-            )
+        print(
+            f"Filter {self.filter_name} dropped {len_before - len(self.df)} lines. Length of dataset is now "
+            f"{int(len(self.df) / self.original_total_requests * 100)} % of original"
+        )
 
     return magic
 
 
 class ErddapLogParser:
     def __init__(self):
+        self._lf = None
         self.df = pl.DataFrame()
         self.ip = pl.DataFrame()
         self.df_xml = pl.DataFrame()
@@ -302,41 +541,91 @@ class ErddapLogParser:
         self.original_total_requests = 0
         self.filter_name = None
 
+    @property
+    def df(self):
+        """Requests DataFrame, with any pending filters applied."""
+        self.collect()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self._lf = None
+
+    def _lazy(self):
+        """Return the pending query plan, starting one if there is none."""
+        if self._lf is None:
+            return self._df.lazy()
+        return self._lf
+
+    def collect(self):
+        """
+        Run pending filters on the requests DataFrame.
+
+        filter_* methods only add their predicates to a lazy query plan,
+        so that polars can evaluate a chain of filters in a single pass.
+        The plan is run the next time df is accessed, or when this method
+        is called.
+        """
+        if self._lf is not None:
+            self._df = self._lf.collect()
+            self._lf = None
+
     def _update_original_total_requests(self):
         """Update the number of requests in the DataFrame."""
         self.original_total_requests = len(self.df)
-        self.unfiltered_df = copy(self.df)
+        self.unfiltered_df = self.df.clone()
         if self.verbose:
             print(f"DataFrame now has {self.original_total_requests} lines")
 
-    def subset_df(self, rows=1000):
-        """Subset the requests DataFrame. Default rows=1000."""
-        stride = int(self.df.shape[0] / rows)
-        if self.verbose:
-            print(
-                f"starting from DataFrame with {self.df.shape[0]} lines. Subsetting by a factor of {stride}"
+    def subset_df(self, rows=1000, sample=False):
+        """
+        Subset the requests DataFrame. Default rows=1000.
+
+        By default every n-th request is kept. If sample is True, a random
+        sample of rows requests is taken instead.
+        """
+        if sample:
+            if self.verbose:
+                print(
+                    f"starting from DataFrame with {self.df.shape[0]} lines. "
+                    f"Sampling {rows} lines"
+                )
+            self.df = self.df.sample(n=min(rows, self.df.shape[0]), seed=0).sort(
+                "datetime"
             )
-        self.df = self.df.gather_every(stride)
+        else:
+            stride = int(self.df.shape[0] / rows)
+            if self.verbose:
+                print(
+                    f"starting from DataFrame with {self.df.shape[0]} lines. Subsetting by a factor of {stride}"
+                )
+            self.df = self.df.gather_every(stride).rechunk()
         if self.verbose:
             print(
                 "resetting number of original total requests to match subset DataFrame"
             )
         self._update_original_total_requests()
 
-    def load_apache_logs(self, apache_logs_dir: str, wildcard_fname="*access.log*"):
-        """Parse apache logs."""
-        df_apache = _load_apache_logs(apache_logs_dir, wildcard_fname)
+    def load_apache_logs(
+        self, apache_logs_dir: str, wildcard_fname="*access.log*", processes=None
+    ):
+        """
+        Parse apache logs.
+
+        Set processes to parse the log files in parallel worker processes.
+        Scripts doing so must guard their entry point with
+        ``if __name__ == "__main__":``.
+        """
+        df_apache = _load_apache_logs(apache_logs_dir, wildcard_fname, processes)
         if self.verbose:
             print(f"loaded {len(df_apache)} log lines from {apache_logs_dir}")
-        df_combi = pl.concat(
-            [
-                self.df,
-                df_apache,
-            ],
-            how="vertical",
-        )
-        df_combi = df_combi.sort("datetime").unique()
-        self.df = df_combi
+        if self.df.is_empty():
+            self.df = df_apache
+        else:
+            self.df = pl.concat([self.df, df_apache], how="vertical", rechunk=False)
+        # rechunk once so the DataFrame is contiguous before filtering/parsing
+        self.df = self.df.sort("datetime").unique(maintain_order=True).rechunk()
         self._update_original_total_requests()
 
     def load_nginx_logs(self, nginx_logs_dir: str, wildcard_fname="*access.log*"):
@@ -344,15 +633,12 @@ class ErddapLogParser:
         df_nginx = _load_nginx_logs(nginx_logs_dir, wildcard_fname)
         if self.verbose:
             print(f"loaded {len(df_nginx)} log lines from {nginx_logs_dir}")
-        df_combi = pl.concat(
-            [
-                self.df,
-                df_nginx,
-            ],
-            how="vertical",
-        )
-        df_combi = df_combi.sort("datetime").unique()
-        self.df = df_combi
+        if self.df.is_empty():
+            self.df = df_nginx
+        else:
+            self.df = pl.concat([self.df, df_nginx], how="vertical", rechunk=False)
+        # rechunk once so the DataFrame is contiguous before filtering/parsing
+        self.df = self.df.sort("datetime").unique(maintain_order=True).rechunk()
         self._update_original_total_requests()
 
     def get_ip_info(self, ip_info_csv="ip.csv", download_new=True, num_ips=60):
@@ -373,30 +659,38 @@ class ErddapLogParser:
     def filter_non_erddap(self):
         """Filter out non-genuine requests."""
         self.filter_name = "non erddap"
-        self.df = self.df.filter(pl.col("url").str.contains("erddap"))
+        self._lf = self._lazy().filter(
+            pl.col("url").str.contains("erddap", literal=True)
+        )
 
     @_print_filter_stats
     def filter_organisations(self, organisations=("Google", "Crawlers", "SEMrush")):
         """Filter out non-visitor requests from specific organizations."""
-        if "org" not in self.df.columns:
+        if "org" not in self._lazy().columns:
             raise ValueError(
                 "Organisation information not present in DataFrame. Try running get_ip_info first.",
             )
-        self.df = self.df.with_columns(pl.col("org").fill_null("unknown"))
-        self.df = self.df.with_columns(pl.col("isp").fill_null("unknown"))
-        for block_org in organisations:
-            self.df = self.df.filter(~pl.col("org").str.contains(f"(?i){block_org}"))
-            self.df = self.df.filter(~pl.col("isp").str.contains(f"(?i){block_org}"))
+        self._lf = self._lazy().with_columns(pl.col("org").fill_null("unknown"))
+        self._lf = self._lazy().with_columns(pl.col("isp").fill_null("unknown"))
+        self._lf = self._lazy().filter(
+            ~_contains_any("org", organisations, case_insensitive=True)
+            & ~_contains_any("isp", organisations, case_insensitive=True)
+        )
         self.filter_name = "organisations"
 
     @_print_filter_stats
     def filter_user_agents(self):
         """Filter out requests from bots."""
         # Added by Samantha Ouertani at NOAA AOML Jan 2024
-        self.df = self.df.filter(
-            ~pl.col("user-agent").map_elements(
-                lambda ua: parse(ua).is_bot, return_dtype=pl.Boolean
-            )
+        # the distinct user agents are needed up front, so run pending filters
+        lookup = _user_agent_lookup(self.df["user-agent"]).select(
+            "user-agent", "is_bot"
+        )
+        self._lf = (
+            self._lazy()
+            .join(lookup.lazy(), on="user-agent", how="left")
+            .filter(~pl.col("is_bot"))
+            .drop("is_bot")
         )
         self.filter_name = "user agents"
 
@@ -404,8 +698,7 @@ class ErddapLogParser:
     def filter_locales(self, locales=("zh-CN", "zh-TW", "ZH")):
         # Added by Samantha Ouertani at NOAA AOML Jan 2024
         """Filter out requests from specific regions (locales)."""
-        for locale in locales:
-            self.df = self.df.filter(~pl.col("url").str.contains(f"{locale}"))
+        self._lf = self._lazy().filter(~_contains_any("url", locales))
         self.filter_name = "locales"
 
     @_print_filter_stats
@@ -429,22 +722,16 @@ class ErddapLogParser:
         Filter out requests from indexing webpages, services monitoring uptime,
         requests for files that aren't on the server, etc
         """
-        page_counts = Counter(
-            list(self.df.select("url").to_numpy()[:, 0])
-        ).most_common()
-        bad_pages = []
-        for page, count in page_counts:
-            for phrase in spam_strings:
-                if phrase in page:
-                    bad_pages.append(page)
-        self.df = self.df.filter(~pl.col("url").is_in(bad_pages))
+        self._lf = self._lazy().filter(~_contains_any("url", spam_strings))
         self.filter_name = "spam"
 
     @_print_filter_stats
     def filter_files(self):
         """Filter out requests for browsing erddap's virtual file system."""
         # Added by Samantha Ouertani at NOAA AOML Jan 2024
-        self.df = self.df.filter(~pl.col("url").str.contains("/files"))
+        self._lf = self._lazy().filter(
+            ~pl.col("url").str.contains("/files", literal=True)
+        )
         self.filter_name = "files"
 
     @_print_filter_stats
@@ -452,19 +739,24 @@ class ErddapLogParser:
         self, strings=("/version", "favicon.ico", ".js", ".css", "/erddap/images")
     ):
         """Filter out non-data requests - requests for version, images, etc"""
-        for string in strings:
-            self.df = self.df.filter(~pl.col("url").str.contains(string))
+        self._lf = self._lazy().filter(~_contains_any("url", strings))
         self.filter_name = "common strings"
 
     def parse_datasets_xml(self, datasets_xml_path):
-        tree = ET.parse(datasets_xml_path)
-        root = tree.getroot()
         dataset_id = []
         dataset_type = []
-        for child in root:
-            if 'datasetID' in child.keys():
-                dataset_id.append(child.get('datasetID'))
-                dataset_type.append(child.get('type'))
+        # stream the file, clearing each top level element once it is read
+        depth = 0
+        for event, elem in ET.iterparse(datasets_xml_path, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if "datasetID" in elem.keys():
+                    dataset_id.append(elem.get("datasetID"))
+                    dataset_type.append(elem.get("type"))
+                elem.clear()
         self.df_xml = pl.DataFrame({'dataset_id': dataset_id, 'dataset_type': dataset_type})
 
     def parse_columns(self):
@@ -478,44 +770,23 @@ class ErddapLogParser:
 
     def anonymize_user_agent(self):
         """Modifies the anonymized dataframe to have browser, device, and os names instead of full user agent."""
-        self.anonymized = self.anonymized.with_columns(
-            pl.col("user-agent")
-            .map_elements(lambda ua: parse(ua).browser.family, return_dtype=pl.String)
-            .alias("BrowserFamily")
-        )
-        self.anonymized = self.anonymized.with_columns(
-            pl.col("user-agent")
-            .map_elements(lambda ua: parse(ua).device.family, return_dtype=pl.String)
-            .alias("DeviceFamily")
-        )
-        self.anonymized = self.anonymized.with_columns(
-            pl.col("user-agent")
-            .map_elements(lambda ua: parse(ua).os.family, return_dtype=pl.String)
-            .alias("OS")
-        )
+        lookup = _user_agent_lookup(self.anonymized["user-agent"]).drop("is_bot")
+        self.anonymized = self.anonymized.join(lookup, on="user-agent", how="left")
         self.anonymized = self.anonymized.drop("user-agent")
 
     def anonymize_ip(self):
         """Replaces the ip address with a unique number identifier."""
-        unique_df = pl.DataFrame(
-            {"ip": self.anonymized.get_column("ip").unique()}
-        ).with_row_index()
-        self.anonymized = self.anonymized.with_columns(
-            pl.col("ip").map_elements(
-                lambda ip: unique_df.row(by_predicate=(pl.col("ip") == ip), named=True)[
-                    "index"
-                ],
-                return_dtype=pl.Int32,
-            )
+        unique_df = self.anonymized.select("ip").unique().with_row_index("ip_id")
+        self.anonymized = (
+            self.anonymized.join(unique_df, on="ip", how="left")
+            .with_columns(ip=pl.col("ip_id").cast(pl.Int32))
+            .drop("ip_id")
         )
 
     def anonymize_query(self):
         """Remove email= and the address from queries."""
         self.anonymized = self.anonymized.with_columns(
-            pl.col("url").map_elements(
-                lambda url: re.sub("email=.*?&", "", url),
-                return_dtype=pl.String,
-            )
+            pl.col("url").str.replace_all(r"email=[^&]*&?", "")
         )
 
     def anonymize_requests(self):
@@ -1,4 +1,8 @@
+import gzip
 import polars as pl
+import pytest
+from user_agents import parse
+import erddaplogs.logparse as logparse
 from erddaplogs.logparse import ErddapLogParser
 import erddaplogs.plot_functions as plot_functions
 
@@ -44,3 +48,132 @@ def test_plots():
     for rank, ip in enumerate(dfa['ip'].to_list()):
         df_sub = df.filter(pl.col('ip') == ip)
         plot_functions.plot_for_single_ip(df_sub, f'visitor_rank_{rank}_ip_{ip}')
+
+
+def test_subset_df():
+    parser = ErddapLogParser()
+    parser.load_nginx_logs("example_data/nginx_example_logs/")
+    parser.subset_df(1000, sample=True)
+    assert len(parser.df) == 1000
+    assert parser.df["datetime"].is_sorted()
+    assert parser.original_total_requests == 1000
+
+
+def test_lazy_filters():
+    parser = ErddapLogParser()
+    parser.load_nginx_logs("example_data/nginx_example_logs/")
+    df = parser.df
+    parser.filter_non_erddap()
+    parser.filter_spam()
+    parser.filter_user_agents()
+    parser.filter_files()
+    parser.collect()
+    spam_strings = (
+        ".env",
+        "env.",
+        ".php",
+        ".git",
+        "robots.txt",
+        "phpinfo",
+        "/config",
+        "aws",
+        ".xml",
+    )
+    expected = df.filter(pl.col("url").str.contains("erddap", literal=True))
+    for spam in spam_strings:
+        expected = expected.filter(~pl.col("url").str.contains(spam, literal=True))
+    expected = expected.filter(
+        ~pl.col("user-agent").map_elements(
+            lambda ua: parse(ua).is_bot, return_dtype=pl.Boolean
+        )
+    )
+    expected = expected.filter(~pl.col("url").str.contains("/files", literal=True))
+    assert len(expected) < len(df)
+    assert parser.df.equals(expected)
+
+
+def test_parse_columns_twice():
+    parser = ErddapLogParser()
+    parser.load_nginx_logs("example_data/nginx_example_logs/")
+    parser.df = parser.df.with_columns(country=pl.lit(None, dtype=pl.Utf8))
+    parser.parse_columns()
+    df_first = parser.df
+    parser.parse_columns()
+    assert parser.df.equals(df_first)
+
+
+@pytest.mark.parametrize("block_size", [None, 7, 100, 4096])
+def test_load_nginx_logs_gzip_crlf(tmp_path, monkeypatch, block_size):
+    log_dir = "example_data/nginx_example_logs/"
+    expected = logparse._load_nginx_logs(log_dir, "tomcat-access.log.1")
+    assert len(expected) > 500
+    with open(f"{log_dir}tomcat-access.log.1", "rb") as fp:
+        log_bytes = fp.read()
+    with gzip.open(tmp_path / "gzip-access.log.gz", "wb") as fp:
+        fp.write(log_bytes)
+    (tmp_path / "crlf-access.log").write_bytes(log_bytes.replace(b"\n", b"\r\n"))
+    if block_size:
+        # 7 bytes is shorter than any log line
+        monkeypatch.setattr(logparse, "LOG_BLOCK_SIZE", block_size)
+    for fname in ("gzip-access.log.gz", "crlf-access.log"):
+        df = logparse._load_nginx_logs(tmp_path, fname)
+        assert df.sort(df.columns).equals(expected.sort(expected.columns))
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {"X-Rl": "10", "X-Ttl": "0"}
+
+    def json(self):
+        return self.payload
+
+
+def _ip_api_result(query):
+    if query == "10.0.0.1":
+        return {"status": "fail", "message": "private range", "query": query}
+    return {"status": "success", "country": "Norway", "query": query}
+
+
+def test_get_ip_info_batches(tmp_path, monkeypatch):
+    batches = []
+
+    def fake_post(url, json):
+        batches.append([entry["query"] for entry in json])
+        return FakeResponse([_ip_api_result(entry["query"]) for entry in json])
+
+    monkeypatch.setattr(logparse.requests, "post", fake_post)
+    ips = ["10.0.0.1"] + [f"192.0.{i // 100}.{i % 100}" for i in range(149)]
+    df = pl.DataFrame({"ip": ips})
+    df_ip = logparse._get_ip_info(df, tmp_path / "ip.csv", num_new_ips=150)
+    assert [len(batch) for batch in batches] == [100, 50]
+    assert set(ips) <= set(df_ip["query"].to_list())
+    failed = df_ip.filter(pl.col("query") == "10.0.0.1")
+    assert failed["status"].to_list() == ["fail"]
+    assert (tmp_path / "ip.csv").exists()
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        FakeResponse({"status": "fail", "message": "invalid query"}),
+        FakeResponse(None, status_code=500),
+        FakeResponse([], status_code=429),
+    ],
+)
+def test_get_ip_info_bad_response(tmp_path, monkeypatch, response):
+    calls = []
+
+    def fake_post(url, json):
+        calls.append(url)
+        return response
+
+    monkeypatch.setattr(logparse.requests, "post", fake_post)
+    monkeypatch.setattr(logparse.time, "sleep", lambda seconds: None)
+    df = pl.DataFrame({"ip": [f"192.0.2.{i}" for i in range(150)]})
+    df_ip = logparse._get_ip_info(df, tmp_path / "ip.csv", num_new_ips=150)
+    # a throttled batch is retried once, any other bad reply stops straight away
+    assert len(calls) == (2 if response.status_code == 429 else 1)
+    assert df_ip["query"].to_list() == [""]